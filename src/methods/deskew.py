@@ -1,53 +1,72 @@
+from functools import lru_cache
+
 import cv2
 import numpy as np
 
 ANGLE_LIMIT = 45
+MIN_CONTOUR_AREA = 10
+ESTIMATE_MAX_SIDE = 1500
+MIN_ROTATE_DEG = 0.1
+
+
+@lru_cache(maxsize=128)
+def rotation_matrix(w: int, h: int, angle: float) -> np.ndarray:
+    m = cv2.getRotationMatrix2D((w / 2.0, h / 2.0), angle, 1.0)
+    m.flags.writeable = False
+    return m
 
 
 def rotate(image: np.ndarray, angle: float) -> np.ndarray:
     h, w = image.shape[:2]
-    center = (w / 2.0, h / 2.0)
-    m = cv2.getRotationMatrix2D(center, angle, 1.0)
+    m = rotation_matrix(w, h, round(angle, 2))
     return cv2.warpAffine(image, m, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
 
 
-def normalize_angle(angle: float) -> float:
-    if angle < -ANGLE_LIMIT:
-        angle += 90
-    elif angle > ANGLE_LIMIT:
-        angle -= 90
-    return angle
+def normalize_angle(angles: np.ndarray) -> np.ndarray:
+    return np.where(angles < -ANGLE_LIMIT, angles + 90, np.where(angles > ANGLE_LIMIT, angles - 90, angles))
 
 
-def get_angle(rectangles: list[tuple[float, tuple[tuple[float, float], tuple[float, float], float]]]) -> float:
-    angles = sorted([normalize_angle(rect[-1]) for _, rect in rectangles])
-    trim_count = int(len(angles) * 0.5)
-    trimmed_angles = angles[trim_count:-trim_count]
-    return sum(trimmed_angles) / len(trimmed_angles) if trimmed_angles else 0.0
+def get_angle(angles: np.ndarray) -> float:
+    # mean of the middle half; partition only has to place the two cut points, not sort everything
+    normalized = normalize_angle(angles)
+    lo = len(normalized) // 4
+    hi = len(normalized) - lo
+    if hi <= lo:
+        return 0.0
+    middle = np.partition(normalized, [lo, hi - 1])[lo:hi]
+    return float(middle.mean())
 
 
-def auto_deskew(image: np.ndarray) -> np.ndarray:
-    if image is None or image.size == 0:
-        return image
-
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 and image.shape[2] == 3 else image
-    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+def estimate_skew_angle(binary: np.ndarray, min_area: float = MIN_CONTOUR_AREA) -> float:
     contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if not contours:
-        return image
-
-    rectangles = []
+    angles = []
     for contour in contours:
-        if cv2.contourArea(contour) < 10:
+        if cv2.contourArea(contour) < min_area:
             continue
-        rectangle = cv2.minAreaRect(contour)
-        width, height = rectangle[1]
+        _, (width, height), angle = cv2.minAreaRect(contour)
         if width == 0 or height == 0:
             continue
-        rectangles.append((width / height, rectangle))
-    if len(rectangles) < 2:
+        angles.append(angle)
+    if len(angles) < 2:
+        return 0.0
+
+    return get_angle(np.array(angles, dtype=np.float64))
+
+
+def auto_deskew(image: np.ndarray) -> np.ndarray:
+    if image is None or image.size == 0:
         return image
 
-    rectangles.sort(key=lambda x: x[0])
-    angle = get_angle(rectangles)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 and image.shape[2] == 3 else image
+
+    # the skew angle survives downscaling, so estimate it on a smaller copy and rotate the original
+    h, w = gray.shape[:2]
+    scale = max(1, max(h, w) // ESTIMATE_MAX_SIDE)
+    if scale > 1:
+        gray = cv2.resize(gray, (w // scale, h // scale), interpolation=cv2.INTER_AREA)
+
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    angle = estimate_skew_angle(binary, MIN_CONTOUR_AREA / scale**2)
+    if abs(angle) < MIN_ROTATE_DEG:
+        return image
     return rotate(image, angle)
@@ -4,13 +4,17 @@ from typing import Iterable, Optional
 import cv2
 import numpy as np
 from PIL import Image
-from scipy.spatial import KDTree
+from scipy.spatial import cKDTree
 
 from models.box import IOU_THRESH, Box
 
 BORDER: int = 5
 WHITE_GAP_RATIO: float = 0.12
 MIN_AREA: int = 20
+# matches the former scipy KDTree default, so equidistant neighbors keep their order
+KD_LEAFSIZE: int = 10
+# initial per-region capacity for grow_regions' merged-component lists
+USED_COLUMNS: int = 16
 
 
 def flatten(indices: int | np.ndarray | Iterable[int]) -> list[int]:
@@ -26,140 +30,158 @@ def flatten(indices: int | np.ndarray | Iterable[int]) -> list[int]:
     return [int(indices)]
 
 
+def longest_run(mask: np.ndarray) -> int:
+    diff = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts = np.flatnonzero(diff == 1)
+    ends = np.flatnonzero(diff == -1)
+    return int((ends - starts).max(initial=0))
+
+
+def black_integral(gray: np.ndarray) -> np.ndarray:
+    return cv2.integral((gray < 128).view(np.uint8), sdepth=cv2.CV_32S)
+
+
 def has_white_gap(
-    image: Image.Image,
+    integral: np.ndarray,
     box: Box,
     *,
     white_ratio_thresh: float = 0.03,
     margin_ratio: float = 0,
 ) -> bool:
-    crop = image.crop((box.x, box.y, box.x + box.w, box.y + box.h)).convert("L")
-    arr = np.array(crop)
-    h, w = arr.shape
+    # integral is black_integral() of the page, so per-row and per-column black counts cost O(h + w)
+    x0, y0 = box.x, box.y
+    x1, y1 = min(box.x + box.w, integral.shape[1] - 1), min(box.y + box.h, integral.shape[0] - 1)
+    h, w = y1 - y0, x1 - x0
 
-    binary = arr < 128
-    black_ratio_per_row = binary.sum(axis=1) / w
-    black_ratio_per_column = binary.sum(axis=0) / h
+    black_per_row = integral[y0 + 1 : y1 + 1, x1] - integral[y0 + 1 : y1 + 1, x0] - integral[y0:y1, x1] + integral[y0:y1, x0]
+    black_per_column = integral[y1, x0 + 1 : x1 + 1] - integral[y0, x0 + 1 : x1 + 1] - integral[y1, x0:x1] + integral[y0, x0:x1]
 
     top, bottom = int(h * margin_ratio), int(h * (1 - margin_ratio))
     left, right = int(w * margin_ratio), int(w * (1 - margin_ratio))
 
-    row_slice: np.ndarray = black_ratio_per_row[top:bottom]
-    row_mask = row_slice <= white_ratio_thresh
-    row_diff = np.diff(np.concatenate([[0], row_mask.astype(int), [0]]))
-    row_starts = np.where(row_diff == 1)[0]
-    row_ends = np.where(row_diff == -1)[0]
-    row_gap_max = (row_ends - row_starts).max() if len(row_starts) > 0 else 0
-    has_horizontal_gap = (row_gap_max / h) >= WHITE_GAP_RATIO
-
-    col_slice: np.ndarray = black_ratio_per_column[left:right]
-    col_mask = col_slice <= white_ratio_thresh
-    col_diff = np.diff(np.concatenate([[0], col_mask.astype(int), [0]]))
-    col_starts = np.where(col_diff == 1)[0]
-    col_ends = np.where(col_diff == -1)[0]
-    col_gap_max = (col_ends - col_starts).max() if len(col_starts) > 0 else 0
-    has_vertical_gap = (col_gap_max / w) >= WHITE_GAP_RATIO
+    # ratio thresholds compared as count <= ratio * length, so the integer counts are never divided
+    row_mask = black_per_row[top:bottom] <= white_ratio_thresh * w
+    has_horizontal_gap = longest_run(row_mask) >= WHITE_GAP_RATIO * h
+
+    col_mask = black_per_column[left:right] <= white_ratio_thresh * h
+    has_vertical_gap = longest_run(col_mask) >= WHITE_GAP_RATIO * w
 
     return has_horizontal_gap or has_vertical_gap
 
 
+def grow_regions(
+    corners: np.ndarray,
+    tree: cKDTree,
+    W_RANGE: Optional[tuple[int, int]] = None,
+    H_RANGE: Optional[tuple[int, int]] = None,
+) -> list[tuple[int, int, int, int]]:
+    # corners holds one (x0, y0, x1, y1) row per component; every component seeds one region and all regions grow
+    # in lockstep, one component per round, so each round needs a single batched tree query
+    # a region only becomes a candidate once it fits both ranges
+    if W_RANGE is None or H_RANGE is None:
+        return []
+    (w_min, w_max), (h_min, h_max) = W_RANGE, H_RANGE
+
+    n = len(corners)
+
+    corners = corners.astype(np.int64)
+    current = corners.copy()
+    # used[i, : step + 1] lists the components merged into region active[i]; rows follow active (a region that stops
+    # never resumes, so its row is dropped) and columns are preallocated, doubling when full, and filled in place
+    used = np.empty((n, min(n, USED_COLUMNS)), dtype=np.intp)
+    used[:, 0] = np.arange(n)
+    best_valid: list[Optional[tuple[int, int, int, int]]] = [None] * n
+    active = np.arange(n)
+    step = 0
+
+    while active.size:
+        cur = current[active]
+        w, h = cur[:, 2] - cur[:, 0], cur[:, 3] - cur[:, 1]
+        fits = (w <= w_max) & (h <= h_max)
+        active, cur, w, h, used = active[fits], cur[fits], w[fits], h[fits], used[fits]
+        valid = (w_min <= w) & (h_min <= h)
+        for i, (x0, y0, _, _), bw, bh in zip(active[valid].tolist(), cur[valid].tolist(), w[valid].tolist(), h[valid].tolist()):
+            best_valid[i] = (x0, y0, bw, bh)
+
+        k = min(8, n - (step + 1))
+        if k <= 0 or not active.size:
+            break
+
+        centers = np.column_stack([cur[:, 0] + w / 2, cur[:, 1] + h / 2])
+        _, neighbors = tree.query(centers, k=k, workers=-1)
+        neighbors = neighbors.reshape(active.size, -1)
+
+        # merged bounds for every (region, neighbor) pair; each region takes its nearest unused neighbor that fits
+        nb = corners[neighbors]
+        merged = np.stack(
+            [
+                np.minimum(cur[:, None, 0], nb[..., 0]),
+                np.minimum(cur[:, None, 1], nb[..., 1]),
+                np.maximum(cur[:, None, 2], nb[..., 2]),
+                np.maximum(cur[:, None, 3], nb[..., 3]),
+            ],
+            axis=-1,
+        )
+        ok = ~(neighbors[:, :, None] == used[:, None, : step + 1]).any(axis=2)
+        ok &= (merged[..., 2] - merged[..., 0] <= w_max) & (merged[..., 3] - merged[..., 1] <= h_max)
+
+        grew = ok.any(axis=1)
+        rows = np.flatnonzero(grew)
+        first = ok[rows].argmax(axis=1)
+
+        used = used[rows]
+        if step + 1 == used.shape[1]:
+            used = np.hstack([used, np.empty_like(used)])
+        used[:, step + 1] = neighbors[rows, first]
+        current[active[rows]] = merged[rows, first]
+        active = active[rows]
+        step += 1
+
+    return [box for box in best_valid if box is not None]
+
+
+def binarize(image_path: Path) -> tuple[np.ndarray, np.ndarray]:
+    gray = np.ascontiguousarray(Image.open(image_path).convert("L"), dtype=np.uint8)
+    _, bw_arr = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY_INV)
+    return gray, bw_arr
+
+
 def detect_image(
     image_path: Path,
     W_RANGE: Optional[tuple[int, int]] = None,
     H_RANGE: Optional[tuple[int, int]] = None,
+    precomputed: Optional[tuple[np.ndarray, np.ndarray]] = None,
 ) -> list[Box]:
-    image = Image.open(image_path).convert("L")
-    cv_image = np.array(image)
-    _, bw_arr = cv2.threshold(cv_image, 128, 255, cv2.THRESH_BINARY_INV)
-    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(bw_arr, connectivity=8)
-
-    components: list[Box] = []
-    for i in range(1, num_labels):
-        x = stats[i, cv2.CC_STAT_LEFT]
-        y = stats[i, cv2.CC_STAT_TOP]
-        w = stats[i, cv2.CC_STAT_WIDTH]
-        h = stats[i, cv2.CC_STAT_HEIGHT]
-
-        area = stats[i, cv2.CC_STAT_AREA]
-        if area >= MIN_AREA:
-            components.append(Box(x, y, w, h))
-    if not components:
+    # precomputed is the (gray, binary) pair from binarize(), shared across calls on the same image
+    gray, bw_arr = precomputed if precomputed is not None else binarize(image_path)
+    num_labels, _, stats, _ = cv2.connectedComponentsWithStats(bw_arr, connectivity=8)
+
+    stats = stats[1:num_labels]
+    stats = stats[stats[:, cv2.CC_STAT_AREA] >= MIN_AREA]
+    if not len(stats):
         return []
 
-    centers = np.array([(b.x + b.w / 2, b.y + b.h / 2) for b in components], dtype=np.float32)
-    tree = KDTree(centers)
-
-    def merge_boxes(boxes: list[Box]) -> Box:
-        if not boxes:
-            return Box(0, 0, 0, 0)
-        xs = np.array([b.x for b in boxes])
-        ys = np.array([b.y for b in boxes])
-        x1s = np.array([b.x + b.w for b in boxes])
-        y1s = np.array([b.y + b.h for b in boxes])
-
-        x0 = xs.min()
-        y0 = ys.min()
-        x1 = x1s.max()
-        y1 = y1s.max()
-        return Box(x0, y0, x1 - x0, y1 - y0)
-
-    candidates: list[Box] = []
-    has_w_range = W_RANGE is not None
-    has_h_range = H_RANGE is not None
-
-    for i, seed in enumerate(components):
-        used_indices = {i}
-        used_boxes = [seed]
-        best_valid: Optional[Box] = None
-        found_new = True
-
-        while found_new:
-            current = merge_boxes(used_boxes)
-            if (has_w_range and current.w > W_RANGE[1]) or (has_h_range and current.h > H_RANGE[1]):
-                break
-            if has_w_range and has_h_range:
-                if W_RANGE[0] <= current.w <= W_RANGE[1] and H_RANGE[0] <= current.h <= H_RANGE[1]:
-                    best_valid = current
-
-            center = np.array([[current.x + current.w / 2, current.y + current.h / 2]])
-            k = min(8, len(components) - len(used_indices))
-            if k <= 0:
-                break
-
-            _, indices = tree.query(center, k=k)
-            indices = np.atleast_1d(indices).reshape(-1)
-            found_new = False
-            for idx in indices:
-                idx = int(idx)
-                if idx in used_indices:
-                    continue
-
-                candidate_box = components[idx]
-                tmp_boxes = used_boxes + [candidate_box]
-                tmp_merged = merge_boxes(tmp_boxes)
-                if (has_w_range and tmp_merged.w > W_RANGE[1]) or (has_h_range and tmp_merged.h > H_RANGE[1]):
-                    continue
-
-                used_indices.add(idx)
-                used_boxes.append(candidate_box)
-                found_new = True
-                break
-
-        if best_valid:
-            candidates.append(best_valid)
+    # components as (N, 4) arrays: x, y, w, h and x0, y0, x1, y1
+    xywh = stats[:, [cv2.CC_STAT_LEFT, cv2.CC_STAT_TOP, cv2.CC_STAT_WIDTH, cv2.CC_STAT_HEIGHT]].astype(np.int32)
+    corners = np.hstack([xywh[:, :2], xywh[:, :2] + xywh[:, 2:]])
+    centers = (xywh[:, :2] + xywh[:, 2:] / 2).astype(np.float32)
+    tree = cKDTree(centers, leafsize=KD_LEAFSIZE, compact_nodes=True, balanced_tree=True)
+    candidates = grow_regions(corners, tree, W_RANGE, H_RANGE)
 
     if not candidates:
         return []
 
-    boxes_np = np.array([[b.x, b.y, b.x + b.w, b.y + b.h] for b in candidates], dtype=np.float32)
-    scores = np.array([b.area for b in candidates], dtype=np.float32)
-    indices = cv2.dnn.NMSBoxes(boxes_np[:, :4].tolist(), scores.tolist(), score_threshold=0.0, nms_threshold=IOU_THRESH)
+    # NMSBoxes takes (x, y, w, h) rows and 1-D scores as arrays; IoU suppression within one rule happens here,
+    # coverage_deduplication only merges results across rules
+    boxes_xywh = np.array(candidates, dtype=np.int32)
+    scores = (boxes_xywh[:, 2] * boxes_xywh[:, 3]).astype(np.float32)
+    indices = cv2.dnn.NMSBoxes(boxes_xywh, scores, score_threshold=0.0, nms_threshold=IOU_THRESH)
 
+    integral = black_integral(gray)
     final: list[Box] = []
     for idx in flatten(indices):
-        idx_int = int(idx)
-        box = candidates[idx_int]
-        if has_white_gap(image, box):
+        box = Box(*candidates[int(idx)])
+        if has_white_gap(integral, box):
             continue
         final.append(Box(box.x - BORDER, box.y - BORDER, box.w + BORDER * 2, box.h + BORDER * 2))
     return final
@@ -170,24 +192,16 @@ def detect_selection(image: Image.Image, rect: Box) -> Optional[Box]:
     x1, y1 = rect.x + rect.w, rect.y + rect.h
 
     crop = image.crop((x0, y0, x1, y1)).convert("L")
-    arr = np.array(crop)
-    mask = arr < 128
-
-    if not mask.any():
-        return None
-
-    rows = np.any(mask, axis=1)
-    cols = np.any(mask, axis=0)
-    if not np.any(rows) or not np.any(cols):
+    mask = (np.asarray(crop) < 128).astype(np.uint8)
+    if cv2.countNonZero(mask) == 0:
         return None
 
-    min_y, max_y = np.where(rows)[0][[0, -1]]
-    min_x, max_x = np.where(cols)[0][[0, -1]]
+    min_x, min_y, w, h = cv2.boundingRect(mask)
     return Box(
         x=x0 + min_x - BORDER,
         y=y0 + min_y - BORDER,
-        w=max_x - min_x + 1 + BORDER * 2,
-        h=max_y - min_y + 1 + BORDER * 2,
+        w=w + BORDER * 2,
+        h=h + BORDER * 2,
         selected=True,
         source="manual",
     )
@@ -1,8 +1,10 @@
 from dataclasses import dataclass
 from typing import Literal
 
+import numpy as np
 
-@dataclass
+
+@dataclass(slots=True)
 class Box:
     x: int
     y: int
@@ -17,16 +19,21 @@ class Box:
 
 
 def iou_data(a: Box, b: Box) -> tuple[float, float, float]:
-    x0 = max(a.x, b.x)
-    y0 = max(a.y, b.y)
-    x1 = min(a.x + a.w, b.x + b.w)
-    y1 = min(a.y + a.h, b.y + b.h)
+    ax, ay, aw, ah = a.x, a.y, a.w, a.h
+    bx, by, bw, bh = b.x, b.y, b.w, b.h
+    a_area, b_area = aw * ah, bw * bh
+
+    # plain comparisons instead of the min/max builtins, which pay for a call per pair
+    x0 = ax if ax > bx else bx
+    y0 = ay if ay > by else by
+    x1 = ax + aw if ax + aw < bx + bw else bx + bw
+    y1 = ay + ah if ay + ah < by + bh else by + bh
     if x1 <= x0 or y1 <= y0:
-        return 0.0, a.area + b.area, 0.0
+        return 0.0, a_area + b_area, 0.0
 
     inter = (x1 - x0) * (y1 - y0)
-    union = a.area + b.area - inter
-    min_area = min(a.area, b.area)
+    union = a_area + b_area - inter
+    min_area = a_area if a_area < b_area else b_area
     return inter, union, min_area
 
 
@@ -49,14 +56,25 @@ def coverage_ratio(a: Box, b: Box) -> float:
 
 
 def coverage_deduplication(boxes: list[Box]) -> list[Box]:
+    if not boxes:
+        return []
+
     sorted_boxes = sorted(boxes, key=lambda b: b.x * b.y)
+    coords = np.array([[b.x, b.y, b.x + b.w, b.y + b.h] for b in sorted_boxes], dtype=np.int64)
+    x0, y0, x1, y1 = coords.T
+    areas = (x1 - x0) * (y1 - y0)
+
+    # greedy: keep the first remaining box, then drop every later box it covers
     final_boxes: list[Box] = []
-    for box in sorted_boxes:
-        drop = False
-        for kept in final_boxes:
-            if coverage_ratio(box, kept) > COVER_THRESH:
-                drop = True
-                break
-        if not drop:
-            final_boxes.append(box)
+    remaining = np.arange(len(sorted_boxes))
+    while remaining.size:
+        i, rest = remaining[0], remaining[1:]
+        final_boxes.append(sorted_boxes[i])
+
+        inter_w = np.minimum(x1[i], x1[rest]) - np.maximum(x0[i], x0[rest])
+        inter_h = np.minimum(y1[i], y1[rest]) - np.maximum(y0[i], y0[rest])
+        inter = np.where((inter_w > 0) & (inter_h > 0), inter_w * inter_h, 0)
+        min_area = np.minimum(areas[i], areas[rest])
+        ratio = np.divide(inter, min_area, out=np.zeros(rest.size), where=min_area >= 0.1)
+        remaining = rest[ratio <= COVER_THRESH]
     return final_boxes
@@ -8,38 +8,45 @@ class Table:
     CMT = 2
 
     def __init__(self) -> None:
-        # fixed 3 columns: [image, character, comment]
-        self.cells: list[list[str]] = []
+        # fixed 3 columns stored column-wise: columns[IMG], columns[CHR], columns[CMT] share one row index
+        self.columns: list[list[str]] = [[], [], []]
 
     def __len__(self) -> int:
-        return len(self.cells)
+        return len(self.columns[self.IMG])
 
     def clear(self) -> None:
-        self.cells = []
+        self.columns = [[], [], []]
 
     def append_row(self, image: str = "", character: str = "", comment: str = "") -> None:
-        self.cells.append([image, character, comment])
+        for column, value in zip(self.columns, (image, character, comment)):
+            column.append(value)
 
     def set_row(self, row: int, image: str = "", character: str = "", comment: str = "") -> None:
         if 0 <= row < self.__len__():
-            self.cells[row] = [image, character, comment]
+            for column, value in zip(self.columns, (image, character, comment)):
+                column[row] = value
         else:
             self.append_row(image, character, comment)
 
     def get_cell(self, row: int, col: int) -> str:
         if 0 <= row < self.__len__() and 0 <= col < 3:
-            return self.cells[row][col]
+            return self.columns[col][row]
         return ""
 
     def set_cell(self, row: int, col: int, value: str) -> None:
         if 0 <= row < self.__len__() and 0 <= col < 3:
-            self.cells[row][col] = value
+            self.columns[col][row] = value
+
+    def set_cells(self, row: int, col: int, values: list[str]) -> None:
+        """Overwrite consecutive cells of one column starting at row; values past the last row are dropped."""
+        if 0 <= row < self.__len__() and 0 <= col < 3:
+            column = self.columns[col]
+            column[row : row + len(values)] = values[: len(column) - row]
 
     def import_images(self, paths: list[Path]) -> None:
         self.clear()
         sorted_paths = sorted(paths, key=lambda p: p.name)
-        for path in sorted_paths:
-            self.append_row(image=str(path))
+        self.columns = [[str(path) for path in sorted_paths], [""] * len(sorted_paths), [""] * len(sorted_paths)]
 
     def import_tsv(self, tsv_path: Path) -> None:
         self.clear()
@@ -47,31 +54,42 @@ class Table:
             raise FileNotFoundError(f"tsv file not found: {tsv_path}")
 
         with open(tsv_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-
-        for line in lines:
-            parts = line.strip().split("\t")
-            image = parts[self.IMG] if len(parts) > self.IMG else ""
-            character = parts[self.CHR] if len(parts) > self.CHR else ""
-            comment = parts[self.CMT] if len(parts) > self.CMT else ""
-            self.append_row(image, character, comment)
+            # each line is stripped before splitting; short rows are padded and extra columns dropped to the fixed
+            # [image, character, comment] layout
+            rows = [(line.strip().split("\t") + ["", "", ""])[:3] for line in f]
+        self.columns = [list(column) for column in zip(*rows)] if rows else [[], [], []]
 
     def export_tsv(self, export_path: Path) -> None:
-        lines = []
-        for row in self.cells:
-            processed_cells = []
-            for cell in row:
-                processed = cell.replace("\t", ">").replace("\n", ">>")
-                processed_cells.append(processed)
-            lines.append("\t".join(processed_cells))
-        export_path.write_text("\n".join(lines), encoding="utf-8")
+        # streamed row by row; rows are newline-separated with no trailing newline
+        # tabs and newlines would break the layout; chained str.replace is several times faster per cell than str.translate
+        lines = ("\t".join(cell.replace("\t", ">").replace("\n", ">>") for cell in row) for row in zip(*self.columns))
+        with open(export_path, "w", encoding="utf-8") as f:
+            first = next(lines, None)
+            if first is not None:
+                f.write(first)
+                f.writelines("\n" + line for line in lines)
+
+    def insert_cell(self, row: int, col: int, value: str) -> None:
+        """Insert a cell into one column, shifting the cells below down; the column's last cell falls off."""
+        if 0 <= row < self.__len__() and 0 <= col < 3:
+            column = self.columns[col]
+            column.insert(row, value)
+            column.pop()
+
+    def remove_cell(self, row: int, col: int, fill: str = "") -> None:
+        """Remove a cell from one column, shifting the cells below up; fill becomes the column's last cell."""
+        if 0 <= row < self.__len__() and 0 <= col < 3:
+            column = self.columns[col]
+            del column[row]
+            column.append(fill)
 
     def swap_rows(self, a: int, b: int) -> None:
         """Swap two rows in-place if both indices are valid."""
         if a == b:
             return
         if 0 <= a < self.__len__() and 0 <= b < self.__len__():
-            self.cells[a], self.cells[b] = self.cells[b], self.cells[a]
+            for column in self.columns:
+                column[a], column[b] = column[b], column[a]
 
     def swap_cells(self, row_a: int, col_a: int, row_b: int, col_b: int) -> None:
         """Swap contents of two cells. Model columns are 0-based (IMG=0, CHR=1, CMT=2)."""
@@ -84,4 +102,4 @@ class Table:
         if not (0 <= col_a < 3 and 0 <= col_b < 3):
             return
 
-        self.cells[row_a][col_a], self.cells[row_b][col_b] = self.cells[row_b][col_b], self.cells[row_a][col_a]
+        self.columns[col_a][row_a], self.columns[col_b][row_b] = self.columns[col_b][row_b], self.columns[col_a][row_a]
@@ -1,5 +1,4 @@
-from typing import Optional
-
+import numpy as np
 from PySide6.QtCore import QPointF, QRectF, Qt
 from PySide6.QtGui import QColor, QPen
 from PySide6.QtWidgets import QGraphicsRectItem, QGraphicsSceneHoverEvent, QGraphicsSceneMouseEvent
@@ -7,20 +6,38 @@ from PySide6.QtWidgets import QGraphicsRectItem, QGraphicsSceneHoverEvent, QGrap
 from models.box import Box
 
 HANDLE_SIZE: int = 6
+# boxes whose bottom edges lie within this many pixels of a line's first box share that line
+LINE_TOL: int = 10
+
+# resize_dir bit flags for the edges a corner handle moves
+LEFT, RIGHT, TOP, BOTTOM = 1, 2, 4, 8
+# cursor shown for each resize_dir
+CURSORS: dict[int, Qt.CursorShape] = {
+    0: Qt.CursorShape.ArrowCursor,
+    TOP | LEFT: Qt.CursorShape.SizeFDiagCursor,
+    TOP | RIGHT: Qt.CursorShape.SizeBDiagCursor,
+    BOTTOM | LEFT: Qt.CursorShape.SizeBDiagCursor,
+    BOTTOM | RIGHT: Qt.CursorShape.SizeFDiagCursor,
+}
+# outline pens shared by every box, built once instead of on each selection change
+SELECTED_PEN = QPen(QColor(0, 200, 0), 2)
+UNSELECTED_PEN = QPen(QColor(200, 0, 0), 2)
 
 
 class BoxItem(QGraphicsRectItem):
     box: Box
     resizing: bool
-    resize_dir: Optional[str]
+    resize_dir: int
     start_rect: QRectF
     start_pos: QPointF
+    edges: tuple[float, float, float, float]
+    area: float
 
     def __init__(self, box: Box) -> None:
         super().__init__(box.x, box.y, box.w, box.h)
         self.box = box
         self.resizing = False
-        self.resize_dir = None
+        self.resize_dir = 0
 
         self.setFlags(
             QGraphicsRectItem.GraphicsItemFlag.ItemIsSelectable
@@ -31,31 +48,39 @@ class BoxItem(QGraphicsRectItem):
         self.update_style()
 
     def update_style(self) -> None:
-        color = QColor(0, 200, 0) if self.box.selected else QColor(200, 0, 0)
-        self.setPen(QPen(color, 2))
+        self.setPen(SELECTED_PEN if self.box.selected else UNSELECTED_PEN)
+        # the pen width feeds the cached area
+        self.cache_edges()
 
-    def hoverMoveEvent(self, event: QGraphicsSceneHoverEvent) -> None:
-        pos = event.pos()
+    def setRect(self, rect: QRectF) -> None:  # type: ignore[override]
+        super().setRect(rect)
+        self.cache_edges()
+
+    def cache_edges(self) -> None:
         rect = self.rect()
-        cursor_shape = Qt.CursorShape.ArrowCursor
-        resize_dir = None
-
-        if abs(pos.x()) < HANDLE_SIZE and abs(pos.y()) < HANDLE_SIZE:
-            resize_dir = "tl"
-            cursor_shape = Qt.CursorShape.SizeFDiagCursor
-        elif abs(pos.x() - rect.width()) < HANDLE_SIZE and abs(pos.y()) < HANDLE_SIZE:
-            resize_dir = "tr"
-            cursor_shape = Qt.CursorShape.SizeBDiagCursor
-        elif abs(pos.x()) < HANDLE_SIZE and abs(pos.y() - rect.height()) < HANDLE_SIZE:
-            resize_dir = "bl"
-            cursor_shape = Qt.CursorShape.SizeBDiagCursor
-        elif abs(pos.x() - rect.width()) < HANDLE_SIZE and abs(pos.y() - rect.height()) < HANDLE_SIZE:
-            resize_dir = "br"
-            cursor_shape = Qt.CursorShape.SizeFDiagCursor
+        self.edges = (rect.left(), rect.top(), rect.right(), rect.bottom())
+        # includes the pen, matching the sceneBoundingRect() the hit-test compared before
+        bounds = self.boundingRect()
+        self.area = bounds.width() * bounds.height()
 
+    def hoverMoveEvent(self, event: QGraphicsSceneHoverEvent) -> None:
+        pos = event.pos()
+        px, py = pos.x(), pos.y()
+        left, top, right, bottom = self.edges
+        resize_dir = 0
+
+        # most hover moves are away from the vertical edges, so the top/bottom checks usually never run;
+        # left wins over right and top over bottom when a small box puts the cursor near both
+        near_x = LEFT if abs(px - left) < HANDLE_SIZE else RIGHT if abs(px - right) < HANDLE_SIZE else 0
+        if near_x:
+            near_y = TOP if abs(py - top) < HANDLE_SIZE else BOTTOM if abs(py - bottom) < HANDLE_SIZE else 0
+            if near_y:
+                resize_dir = near_x | near_y
+
+        # setCursor only when crossing into or out of a handle, not on every hover tick
         if resize_dir != self.resize_dir:
             self.resize_dir = resize_dir
-            self.setCursor(cursor_shape)
+            self.setCursor(CURSORS[resize_dir])
 
         super().hoverMoveEvent(event)
 
@@ -71,14 +96,15 @@ class BoxItem(QGraphicsRectItem):
         if self.resizing and self.resize_dir:
             delta = event.pos() - self.start_pos
             r = QRectF(self.start_rect)
+            flags = self.resize_dir
 
-            if "l" in self.resize_dir:
+            if flags & LEFT:
                 r.setLeft(r.left() + delta.x())
-            if "r" in self.resize_dir:
+            if flags & RIGHT:
                 r.setRight(r.right() + delta.x())
-            if "t" in self.resize_dir:
+            if flags & TOP:
                 r.setTop(r.top() + delta.y())
-            if "b" in self.resize_dir:
+            if flags & BOTTOM:
                 r.setBottom(r.bottom() + delta.y())
 
             self.setRect(r.normalized())
@@ -96,40 +122,29 @@ class BoxItem(QGraphicsRectItem):
 
 
 def sort_reading_order(box_items: list[BoxItem], image_width: int, column_count: int) -> list[BoxItem]:
-
-    def sort_single_column(items: list[BoxItem], line_tol: int = 10) -> list[BoxItem]:
-        entries = [(item, item.box.x, item.box.y + item.box.h) for item in items]
-        entries.sort(key=lambda e: e[2])
-
-        lines: list[list[tuple[BoxItem, int, int]]] = []
-        for entry in entries:
-            box_item, x, y = entry
-            placed = False
-            for line in lines:
-                _, _, ly = line[0]
-                if abs(y - ly) <= line_tol:
-                    line.append(entry)
-                    placed = True
-                    break
-            if not placed:
-                lines.append([entry])
-
-        result: list[BoxItem] = []
-        for line in lines:
-            line.sort(key=lambda e: e[1])
-            result.extend(box for box, _, _ in line)
-
-        return result
-
-    col_width = image_width / column_count
-    columns: list[list[BoxItem]] = [[] for _ in range(column_count)]
-
-    for b in box_items:
-        center_x = b.box.x + b.box.w / 2
-        col_idx = min(int(center_x // col_width), column_count - 1)
-        columns[col_idx].append(b)
-
-    ordered: list[BoxItem] = []
-    for col_boxes in columns:
-        ordered.extend(sort_single_column(col_boxes))
-    return ordered
+    if not box_items:
+        return []
+
+    coords = np.array([(b.box.x, b.box.y + b.box.h, b.box.w) for b in box_items], dtype=np.int64)
+    xs, bottoms, ws = coords[:, 0], coords[:, 1], coords[:, 2]
+    # column of the box center, (x + w / 2) // (image_width / column_count), in exact integer arithmetic;
+    # negative indices wrap around, as they did when indexing the column list
+    cols = np.minimum((2 * xs + ws) * column_count // (2 * image_width), column_count - 1) % column_count
+
+    # stable, so equal bottoms keep their input order
+    by_bottom = np.lexsort((bottoms, cols))
+
+    # walking by bottom edge, a box can only join the newest line of its column (anchored at its first box)
+    line_ids = np.empty(len(by_bottom), dtype=np.intp)
+    line = -1
+    prev_col = -1
+    anchor_y = 0
+    for i, (col, bottom) in enumerate(zip(cols[by_bottom].tolist(), bottoms[by_bottom].tolist())):
+        if col != prev_col or bottom - anchor_y > LINE_TOL:
+            line += 1
+            prev_col = col
+            anchor_y = bottom
+        line_ids[i] = line
+
+    order = by_bottom[np.lexsort((xs[by_bottom], line_ids))]
+    return [box_items[i] for i in order.tolist()]
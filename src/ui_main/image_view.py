@@ -1,14 +1,41 @@
+from functools import lru_cache, partial
 from pathlib import Path
 from typing import Optional
 
-from PySide6.QtCore import QPoint, QRect, QRectF, QSize, Qt, Signal
-from PySide6.QtGui import QBrush, QKeyEvent, QKeySequence, QMouseEvent, QPainter, QPixmap, QWheelEvent
+from PySide6.QtCore import QMetaMethod, QPoint, QPointF, QRect, QRectF, QSize, Qt, QThreadPool, QTimer, Signal, SignalInstance
+from PySide6.QtGui import QBrush, QImage, QKeyEvent, QKeySequence, QMouseEvent, QPainter, QPixmap, QWheelEvent
 from PySide6.QtWidgets import QGraphicsScene, QGraphicsView, QRubberBand
 
 from models.box import Box
 from ui_main.box_item import BoxItem
 
 ZOOM_FACTOR = 1.2
+# at most one status update per frame while the mouse moves
+STATUS_INTERVAL_MS = 16
+# decoded pages kept around: the current one and its two neighbours, since a full-page scan is tens of MB
+PIXMAP_CACHE_SIZE = 3
+# pages decoded ahead of time by prefetch(), the two neighbours of the current one
+IMAGE_CACHE_SIZE = 2
+# below this many boxes a linear scan is cheaper than keeping a BSP tree up to date through moves and resizes
+BSP_MIN_ITEMS = 1000
+
+
+@lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def load_qimage(path: str, mtime_ns: int) -> QImage:
+    # QImage, unlike QPixmap, may be decoded off the GUI thread
+    return QImage(path)
+
+
+@lru_cache(maxsize=PIXMAP_CACHE_SIZE)
+def load_pixmap(path: str, mtime_ns: int) -> QPixmap:
+    # mtime_ns is part of the key so a rewritten file is decoded again
+    return QPixmap.fromImage(load_qimage(path, mtime_ns))
+
+
+def clear_page_caches() -> None:
+    # pages of a previously opened folder are not revisited
+    load_pixmap.cache_clear()
+    load_qimage.cache_clear()
 
 
 class ImageView(QGraphicsView):
@@ -23,50 +50,107 @@ class ImageView(QGraphicsView):
 
     def __init__(self, parent=None) -> None:
         super().__init__(parent)
+        # signal name -> whether anything listens, kept current by connectNotify/disconnectNotify
+        self._connected: dict[str, bool] = {}
         self.setScene(QGraphicsScene(self))
+        self.scene().setItemIndexMethod(QGraphicsScene.ItemIndexMethod.NoIndex)
         self.box_items = []
+        # the page item lives as long as the scene; switching pages only swaps its pixmap
+        self._pix_item = self.scene().addPixmap(QPixmap())
+        # (path, mtime) of the page on screen; reloading it only has to drop the boxes
+        self._image_key: Optional[tuple[str, int]] = None
 
         self._rubber = QRubberBand(QRubberBand.Shape.Rectangle, self)
         self._origin_scene: Optional[QPoint] = None
+        # view position of the selection origin; dropped whenever the view scrolls or zooms
+        self._origin_view: Optional[QPoint] = None
         self._select_mode = False
         self._zoom = 1.0
 
         self.setTransformationAnchor(QGraphicsView.ViewportAnchor.AnchorUnderMouse)
 
+        # leading update on the first move, trailing update with the latest position when the interval ends
+        self._move_pos: Optional[QPointF] = None
+        # last values sent from mouse moves; sub-pixel moves within the same pixel format the same text
+        self._last_pixel: Optional[tuple[int, int]] = None
+        self._last_box_count = -1
+        self._status_timer = QTimer(self)
+        self._status_timer.setSingleShot(True)
+        self._status_timer.setInterval(STATUS_INTERVAL_MS)
+        self._status_timer.timeout.connect(self._emit_move_status)
+
+        # status texts queued within one event-loop pass; only the latest text per signal is emitted
+        self._pending_status: dict[SignalInstance, str] = {}
+
     def load_image(self, path: Path) -> None:
-        self.scene().clear()
-        self.box_items.clear()
+        self.clear_boxes()
 
-        pixmap = QPixmap(str(path))
-        self.scene().addPixmap(pixmap)
+        key = (str(path), path.stat().st_mtime_ns)
+        if key == self._image_key:
+            return
+        self._image_key = key
+        pixmap = load_pixmap(*key)
+        self._pix_item.setPixmap(pixmap)
         self.setSceneRect(pixmap.rect())
 
+    def update_index_method(self) -> None:
+        if len(self.box_items) >= BSP_MIN_ITEMS:
+            index_method = QGraphicsScene.ItemIndexMethod.BspTreeIndex
+        else:
+            index_method = QGraphicsScene.ItemIndexMethod.NoIndex
+        if self.scene().itemIndexMethod() != index_method:
+            self.scene().setItemIndexMethod(index_method)
+
+    def prefetch(self, path: Path) -> None:
+        QThreadPool.globalInstance().start(partial(load_qimage, str(path), path.stat().st_mtime_ns))
+
+    def clear_boxes(self) -> None:
+        scene = self.scene()
+        scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.NoIndex)
+        scene.blockSignals(True)
+        try:
+            for item in self.box_items:
+                scene.removeItem(item)
+        finally:
+            scene.blockSignals(False)
+        self.box_items.clear()
+
     def load_boxes(self, boxes: list[Box]) -> None:
-        for box in boxes:
-            item = BoxItem(box)
-            self.scene().addItem(item)
-            self.box_items.append(item)
+        # a BSP index, if the page needs one, is built once after the bulk insert instead of updated per item
+        scene = self.scene()
+        scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.NoIndex)
+        scene.blockSignals(True)
+        try:
+            for box in boxes:
+                item = BoxItem(box)
+                scene.addItem(item)
+                self.box_items.append(item)
+        finally:
+            scene.blockSignals(False)
+            self.update_index_method()
 
     def delete_selected_boxes(self) -> None:
-        for item in self.scene().selectedItems():
-            if isinstance(item, BoxItem):
-                self.scene().removeItem(item)
-                if item in self.box_items:
-                    self.box_items.remove(item)
+        scene = self.scene()
+        selected = {item for item in scene.selectedItems() if isinstance(item, BoxItem)}
+        if not selected:
+            return
+        # one selectionChanged per removed item is useless noise for a bulk delete
+        scene.blockSignals(True)
+        try:
+            for item in selected:
+                scene.removeItem(item)
+        finally:
+            scene.blockSignals(False)
+        self.box_items[:] = [item for item in self.box_items if item not in selected]
+        self.update_index_method()
 
     def select_box(self, scene_pos: QPoint) -> None:
-        for item in self.box_items:
-            item.setSelected(False)
-
-        candidates: list[tuple[float, BoxItem]] = []
-        for item in self.scene().items(scene_pos):
-            if isinstance(item, BoxItem):
-                rect = item.sceneBoundingRect()
-                if rect.contains(scene_pos):
-                    area = rect.width() * rect.height()
-                    candidates.append((area, item))
+        # clear in one pass; on large pages the point query below is answered by the scene's BSP index
+        self.scene().clearSelection()
+
+        candidates = [item for item in self.scene().items(scene_pos) if isinstance(item, BoxItem)]
         if candidates:
-            _, smallest = min(candidates, key=lambda pair: pair[0])
+            smallest = min(candidates, key=lambda item: item.area)
             smallest.setSelected(not smallest.isSelected())
 
     def fit_to_view(self) -> None:
@@ -74,7 +158,8 @@ class ImageView(QGraphicsView):
         self.resetTransform()
         self.fitInView(scene_rect, Qt.AspectRatioMode.KeepAspectRatio)
         self._zoom = self.transform().m11()
-        self.zoom_changed.emit(f"Zoom: {(self._zoom * 100):.2f}%")
+        self._origin_view = None
+        self._emit_zoom()
 
     def zoom_to_rect(self, rect: QRect) -> None:
         if rect.isNull() or rect.width() < 5 or rect.height() < 5:
@@ -82,38 +167,88 @@ class ImageView(QGraphicsView):
         self.resetTransform()
         self.fitInView(rect, Qt.AspectRatioMode.KeepAspectRatio)
         self._zoom = self.transform().m11()
-        self.zoom_changed.emit(f"Zoom: {(self._zoom * 100):.2f}%")
+        self._origin_view = None
+        self._emit_zoom()
 
     def mousePressEvent(self, event: QMouseEvent) -> None:
         if event.button() == Qt.MouseButton.LeftButton or event.modifiers() & Qt.KeyboardModifier.ShiftModifier:
             self._select_mode = True
             self._origin_scene = self.mapToScene(event.pos()).toPoint()
-            origin_view_pos = event.pos()
-            self._rubber.setGeometry(QRect(origin_view_pos, QSize()))
+            self._origin_view = event.pos()
+            self._last_pixel = None
+            self._rubber.setGeometry(QRect(self._origin_view, QSize()))
             self._rubber.show()
-            self.sel_str.emit(f"Select: ({int(self._origin_scene.x())}, {int(self._origin_scene.y())}), Size: (0, 0)")
+            if self._connected.get("sel_str"):
+                self._emit_latest(self.sel_str, f"Select: ({int(self._origin_scene.x())}, {int(self._origin_scene.y())}), Size: (0, 0)")
             return
         super().mousePressEvent(event)
 
-    def mouseMoveEvent(self, event: QMouseEvent) -> None:
-        scene_pos = self.mapToScene(event.pos())
-        self.pos_str.emit(f"Pos: ({int(scene_pos.x())}, {int(scene_pos.y())})")
-        self.box_str.emit(f"Box: {len(self.box_items)}")
+    def _origin_view_pos(self) -> QPoint:
+        if self._origin_view is None:
+            self._origin_view = self.mapFromScene(self._origin_scene)
+        return self._origin_view
 
-        if self._select_mode and self._origin_scene is not None:
+    def scrollContentsBy(self, dx: int, dy: int) -> None:
+        self._origin_view = None
+        super().scrollContentsBy(dx, dy)
+
+    def connectNotify(self, signal: QMetaMethod) -> None:
+        super().connectNotify(signal)
+        self._connected[signal.name().data().decode()] = self.isSignalConnected(signal)
+
+    def disconnectNotify(self, signal: QMetaMethod) -> None:
+        super().disconnectNotify(signal)
+        self._connected[signal.name().data().decode()] = self.isSignalConnected(signal)
+
+    def _emit_latest(self, signal: SignalInstance, text: str) -> None:
+        if not self._pending_status:
+            QTimer.singleShot(0, self._flush_status)
+        self._pending_status[signal] = text
+
+    def _flush_status(self) -> None:
+        pending, self._pending_status = self._pending_status, {}
+        for signal, text in pending.items():
+            signal.emit(text)
+
+    def _emit_zoom(self) -> None:
+        if self._connected.get("zoom_changed"):
+            self._emit_latest(self.zoom_changed, f"Zoom: {(self._zoom * 100):.2f}%")
+
+    def _emit_move_status(self) -> None:
+        scene_pos = self._move_pos
+        if scene_pos is None:
+            return
+        if self._connected.get("box_str") and len(self.box_items) != self._last_box_count:
+            self._last_box_count = len(self.box_items)
+            self._emit_latest(self.box_str, f"Box: {self._last_box_count}")
+
+        x1, y1 = int(scene_pos.x()), int(scene_pos.y())
+        if (x1, y1) == self._last_pixel:
+            return
+        self._last_pixel = (x1, y1)
+        if self._connected.get("pos_str"):
+            self._emit_latest(self.pos_str, f"Pos: ({x1}, {y1})")
+
+        if self._select_mode and self._origin_scene is not None and self._connected.get("sel_str"):
             x0, y0 = self._origin_scene.x(), self._origin_scene.y()
-            x1, y1 = scene_pos.x(), scene_pos.y()
+            xf, yf = scene_pos.x(), scene_pos.y()
+            width, height = abs(xf - x0), abs(yf - y0)
+            self._emit_latest(self.sel_str, f"Select: ({int(min(x0, xf))}, {int(min(y0, yf))}), Size: ({int(width)}, {int(height)})")
 
-            rect_view = QRect(self.mapFromScene(self._origin_scene), event.pos()).normalized()
-            self._rubber.setGeometry(rect_view)
+    def mouseMoveEvent(self, event: QMouseEvent) -> None:
+        self._move_pos = self.mapToScene(event.pos())
+        if not self._status_timer.isActive():
+            self._emit_move_status()
+            self._status_timer.start()
 
-            width, height = abs(x1 - x0), abs(y1 - y0)
-            self.sel_str.emit(f"Select: ({int(min(x0, x1))}, {int(min(y0, y1))}), Size: ({int(width)}, {int(height)})")
+        if self._select_mode and self._origin_scene is not None:
+            rect_view = QRect(self._origin_view_pos(), event.pos()).normalized()
+            self._rubber.setGeometry(rect_view)
             return
         super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event: QMouseEvent) -> None:
-        self.sel_str.emit("Select: (-, -), Size: (-, -)")
+        self._emit_latest(self.sel_str, "Select: (-, -), Size: (-, -)")
 
         if self._select_mode and self._origin_scene is not None:
             x0, y0 = self._origin_scene.x(), self._origin_scene.y()
@@ -126,7 +261,7 @@ class ImageView(QGraphicsView):
                 self.select_box(end_scene_point)
 
             self._rubber.hide()
-            rect_view = QRect(self.mapFromScene(self._origin_scene), event.pos()).normalized()
+            rect_view = QRect(self._origin_view_pos(), event.pos()).normalized()
             scene_rect = self.mapToScene(rect_view).boundingRect().toRect()
 
             modifiers = event.modifiers()
@@ -144,6 +279,7 @@ class ImageView(QGraphicsView):
                             item.setSelected(True)
 
             self._origin_scene = None
+            self._origin_view = None
             self._select_mode = False
             return
         super().mouseReleaseEvent(event)
@@ -162,7 +298,8 @@ class ImageView(QGraphicsView):
             factor = ZOOM_FACTOR if delta > 0 else 1 / ZOOM_FACTOR
             self.scale(factor, factor)
             self._zoom *= factor
-            self.zoom_changed.emit(f"Zoom: {(self._zoom * 100):.2f}%")
+            self._origin_view = None
+            self._emit_zoom()
             return
 
         super().wheelEvent(event)
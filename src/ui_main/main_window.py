@@ -1,10 +1,16 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import Iterable, Optional
 
 import cv2
+import numpy as np
 from PIL import Image
-from PySide6.QtCore import QRect, Qt
-from PySide6.QtGui import QDragEnterEvent, QDropEvent, QKeyEvent, QMouseEvent
+from PySide6.QtCore import QObject, QRect, QRunnable, Qt, QThreadPool, QTimer, Signal, Slot
+from PySide6.QtGui import QCloseEvent, QDragEnterEvent, QDropEvent, QKeyEvent, QMouseEvent
 from PySide6.QtWidgets import (
     QFileDialog,
     QHBoxLayout,
@@ -23,13 +29,57 @@ from PySide6.QtWidgets import (
 )
 
 from methods.deskew import auto_deskew
-from methods.detector import detect_image, detect_selection
+from methods.detector import binarize, detect_image, detect_selection
 from models.box import Box, coverage_deduplication
 from models.state import AppState
 from ui_main.box_item import BoxItem, sort_reading_order
-from ui_main.image_view import ImageView
+from ui_main.image_view import ImageView, clear_page_caches
 from ui_table.table_view import TextTableDialog
 
+IMAGE_SUFFIXES = frozenset({".png", ".jpg", ".jpeg"})
+# deskewed file name -> digest of the source it was made from, kept next to the deskewed pages
+DESKEW_INDEX = "index.json"
+# index updates within this window are written out together rather than once per finished page
+INDEX_FLUSH_MS = 2000
+# how long a failure note stays in the status bar
+STATUS_MESSAGE_MS = 5000
+# decoded pages kept for repeated exports of the same page
+EXPORT_CACHE_SIZE = 4
+# grayscale pages kept for rubber-band selections
+SELECTION_CACHE_SIZE = 2
+# binarised pages kept for re-running detection with other rules
+DETECT_CACHE_SIZE = 2
+
+
+@lru_cache(maxsize=EXPORT_CACHE_SIZE)
+def read_page(path: str, mtime_ns: int) -> Optional[np.ndarray]:
+    img = cv2.imread(path)
+    if img is not None:
+        # shared between exports, so nobody may write into it
+        img.flags.writeable = False
+    return img
+
+
+def write_png(path: Path, img: np.ndarray) -> None:
+    # encode in memory and write once; both steps release the GIL
+    ok, buf = cv2.imencode(".png", img)
+    assert ok, f"Failed to encode image: {path}"
+    path.write_bytes(buf)
+
+
+@lru_cache(maxsize=DETECT_CACHE_SIZE)
+def binarize_page(path: str, mtime_ns: int) -> tuple[np.ndarray, np.ndarray]:
+    gray, binary = binarize(Path(path))
+    gray.flags.writeable = False
+    binary.flags.writeable = False
+    return gray, binary
+
+
+@lru_cache(maxsize=SELECTION_CACHE_SIZE)
+def open_page_gray(path: str, mtime_ns: int) -> Image.Image:
+    # convert() decodes eagerly, so later crops never hit the lazy loader
+    return Image.open(path).convert("L")
+
 
 class TableWidget(QTableWidget):
     def __init__(self) -> None:
@@ -45,6 +95,7 @@ class TableWidget(QTableWidget):
 
         self.itemChanged.connect(self._on_item_changed)
 
+    @Slot(QTableWidgetItem)
     def _on_item_changed(self, item: QTableWidgetItem) -> None:
         column_map = {0: 2, 1: 3}
 
@@ -58,6 +109,22 @@ class TableWidget(QTableWidget):
             target_item.setText(text)
             self.blockSignals(False)
 
+    def cell_value(self, row: int, col: int) -> int:
+        item = self.item(row, col)
+        return int(item.text() or 0) if item is not None else 0
+
+    def rules(self) -> list[tuple[int, int, int, int]]:
+        # usable (w_min, w_max, h_min, h_max) rows in table order; repeated rows would only repeat the same detection
+        rules: dict[tuple[int, int, int, int], None] = {}
+        for row in range(self.rowCount()):
+            try:
+                w_min, w_max, h_min, h_max = (self.cell_value(row, col) for col in range(4))
+            except ValueError:
+                continue
+            if w_min < w_max and h_min < h_max and max(w_max, h_max) > 0:
+                rules[(w_min, w_max, h_min, h_max)] = None
+        return list(rules)
+
     def mouseDoubleClickEvent(self, event: QMouseEvent) -> None:
         if event.button() == Qt.MouseButton.LeftButton:
             self.insertRow(self.rowCount())
@@ -66,6 +133,70 @@ class TableWidget(QTableWidget):
         super().mouseDoubleClickEvent(event)
 
 
+class DeskewSignals(QObject):
+    # source path, deskewed path, source digest
+    finished = Signal(object, object, str)
+    # source path
+    failed = Signal(object)
+
+
+class DeskewWorker(QRunnable):
+    def __init__(self, path: Path, deskew_path: Path, known_digest: Optional[str]) -> None:
+        super().__init__()
+        self.path = path
+        self.deskew_path = deskew_path
+        self.known_digest = known_digest
+        self.signals = DeskewSignals()
+
+    def run(self) -> None:
+        # every run ends in exactly one signal, so the window can always release the page's slot
+        try:
+            data = self.path.read_bytes()
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            # hashing is far cheaper than deskewing, so an unchanged source keeps its earlier result
+            if digest != self.known_digest or not self.deskew_path.exists():
+                img_cv = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                if img_cv is None:
+                    raise ValueError(f"Failed to load image: {self.path}")
+                if not cv2.imwrite(str(self.deskew_path), auto_deskew(img_cv)):
+                    raise OSError(f"Failed to write image: {self.deskew_path}")
+        except Exception as e:
+            print(f"Deskew failed: {e}")
+            self.signals.failed.emit(self.path)
+            return
+        self.signals.finished.emit(self.path, self.deskew_path, digest)
+
+
+class DetectSignals(QObject):
+    # job id, page path, deduplicated boxes
+    finished = Signal(int, object, object)
+    # job id
+    failed = Signal(int)
+
+
+class DetectWorker(QRunnable):
+    def __init__(self, job: int, path: Path, rules: list[tuple[int, int, int, int]]) -> None:
+        super().__init__()
+        self.job = job
+        self.path = path
+        self.rules = rules
+        self.signals = DetectSignals()
+
+    def run(self) -> None:
+        try:
+            boxes: list[Box] = []
+            if self.rules:
+                precomputed = binarize_page(str(self.path), self.path.stat().st_mtime_ns)
+                for w_min, w_max, h_min, h_max in self.rules:
+                    boxes.extend(detect_image(self.path, W_RANGE=(w_min, w_max), H_RANGE=(h_min, h_max), precomputed=precomputed))
+            final_boxes = coverage_deduplication(boxes)
+        except Exception as e:
+            print(f"Detect failed: {e}")
+            self.signals.failed.emit(self.job)
+            return
+        self.signals.finished.emit(self.job, self.path, final_boxes)
+
+
 class FileList(QListWidget):
     def load_files(self, paths: Iterable[Path]) -> None:
         self.clear()
@@ -82,6 +213,26 @@ class MainWindow(QMainWindow):
 
         self.state = AppState()
 
+        # every opened page is deskewed in the background, one worker per core; the selected page jumps the queue
+        self._deskew_pool = QThreadPool(self)
+        self._deskew_pending: list[Path] = []
+        self._deskew_running: set[Path] = set()
+        self._deskewed: dict[Path, Path] = {}
+        self._deskew_index: dict[Path, dict[str, str]] = {}
+        # deskew dirs whose index has unwritten changes
+        self._index_dirty: set[Path] = set()
+        self._index_timer = QTimer(self)
+        self._index_timer.setSingleShot(True)
+        self._index_timer.setInterval(INDEX_FLUSH_MS)
+        self._index_timer.timeout.connect(self.flush_deskew_index)
+        # deskewed path -> the source that claimed it
+        self._deskew_owner: dict[Path, Path] = {}
+        # selected page whose deskew is still running
+        self._deskew_wanted: Optional[Path] = None
+        self._detect_queued = False
+        # a newer detect request supersedes a running one; its result is dropped when it arrives
+        self._detect_job = 0
+
         self.file_list = FileList()
         self.file_list.currentItemChanged.connect(self.on_file_changed)
 
@@ -164,11 +315,13 @@ class MainWindow(QMainWindow):
         self.image_view.selection_finished.connect(self.on_selection_finished)
         self.image_view.zoom_changed.connect(self.status_zoom.setText)
 
+    @Slot()
     def open_images(self) -> None:
         files, _ = QFileDialog.getOpenFileNames(self, "Open Images", "", "Images (*.png *.jpg *.jpeg)")
         if files:
             self.add_files(files)
 
+    @Slot()
     def open_text_table(self) -> None:
         dialog = TextTableDialog(self)
         dialog.exec()
@@ -178,22 +331,41 @@ class MainWindow(QMainWindow):
             event.acceptProposedAction()
 
     def dropEvent(self, event: QDropEvent) -> None:
-        files = [url.toLocalFile() for url in event.mimeData().urls() if url.toLocalFile().lower().endswith((".png", ".jpg", ".jpeg"))]
+        files = [f for f in (url.toLocalFile() for url in event.mimeData().urls()) if Path(f).suffix.lower() in IMAGE_SUFFIXES]
         if files:
             self.add_files(files)
 
+    def closeEvent(self, event: QCloseEvent) -> None:
+        self.flush_deskew_index()
+        super().closeEvent(event)
+
     def add_files(self, files: list[str]) -> None:
         paths = [Path(f) for f in sorted(files)]
+        self.flush_deskew_index()
+        clear_page_caches()
+        for cache in (read_page, binarize_page, open_page_gray):
+            cache.cache_clear()
+        # re-opened pages go through the worker again, whose digest check decides whether to redo the deskew;
+        # pages queued from the previous batch are no longer listed
+        self._deskew_pending.clear()
+        for p in paths:
+            self._deskewed.pop(p, None)
         self.file_list.load_files(paths)
         for p in paths:
             self.state.images[p] = None
+            # claim output names in list order, so stem clashes resolve the same way in every session
+            self.deskew_target(p)
         self.file_list.setCurrentRow(0)
+        for p in paths:
+            self.start_deskew(p)
 
+    @Slot()
     def select_export_directory(self) -> None:
         directory = QFileDialog.getExistingDirectory(self, "Select Export Directory")
         if directory:
             self.export_dir.setText(directory)
 
+    @Slot(QListWidgetItem)
     def on_file_changed(self, current: Optional[QListWidgetItem]) -> None:
         if not current:
             return
@@ -202,24 +374,117 @@ class MainWindow(QMainWindow):
             self.state.images[self.state.current] = [item.box for item in self.image_view.box_items]
 
         path = Path(current.text())
-        img_cv = cv2.imread(str(path))
-        assert img_cv is not None, f"Failed to load image: {path}"
-        deskew_img = auto_deskew(img_cv)
+        default_export_dir = path.parent.parent / "result"
+        self.export_dir.setText(str(default_export_dir))
 
+        self._deskew_wanted = path
+        if path in self._deskewed:
+            self.show_deskewed(path)
+            return
+
+        # show the raw page right away; the deskewed one replaces it when the worker is done
+        self.state.current = None
+        self.image_view.load_image(path)
+        self.start_deskew(path, urgent=True)
+
+    def start_deskew(self, path: Path, urgent: bool = False) -> None:
+        if path in self._deskewed or path in self._deskew_running:
+            return
+        if urgent:
+            if path in self._deskew_pending:
+                self._deskew_pending.remove(path)
+            self._deskew_pending.insert(0, path)
+        elif path not in self._deskew_pending:
+            self._deskew_pending.append(path)
+        self._pump_deskew()
+
+    def _pump_deskew(self) -> None:
+        # hand out pages only as threads free up, so the queue order can still change
+        while self._deskew_pending and len(self._deskew_running) < self._deskew_pool.maxThreadCount():
+            path = self._deskew_pending.pop(0)
+            deskew_path = self.deskew_target(path)
+            deskew_path.parent.mkdir(exist_ok=True, parents=True)
+            worker = DeskewWorker(path, deskew_path, self.deskew_index(deskew_path.parent).get(deskew_path.name))
+            worker.signals.finished.connect(self.on_deskew_finished)
+            worker.signals.failed.connect(self.on_deskew_failed)
+            self._deskew_running.add(path)
+            self._deskew_pool.start(worker)
+
+    @Slot()
+    def flush_deskew_index(self) -> None:
+        self._index_timer.stop()
+        for deskew_dir in self._index_dirty:
+            (deskew_dir / DESKEW_INDEX).write_text(json.dumps(self._deskew_index[deskew_dir], indent=2), encoding="utf-8")
+        self._index_dirty.clear()
+
+    def deskew_target(self, path: Path) -> Path:
+        # sources sharing a stem under one grandparent would share an output file, so later ones get a numbered name
         deskew_dir = path.parent.parent / "deskew"
-        deskew_dir.mkdir(exist_ok=True, parents=True)
         deskew_path = deskew_dir / f"{path.stem}.deskew.png"
-        cv2.imwrite(str(deskew_path), deskew_img)
-        self.state.current = deskew_path
+        n = 1
+        while self._deskew_owner.setdefault(deskew_path, path) != path:
+            deskew_path = deskew_dir / f"{path.stem}.{n}.deskew.png"
+            n += 1
+        return deskew_path
+
+    def deskew_index(self, deskew_dir: Path) -> dict[str, str]:
+        index = self._deskew_index.get(deskew_dir)
+        if index is None:
+            try:
+                index = json.loads((deskew_dir / DESKEW_INDEX).read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                index = {}
+            self._deskew_index[deskew_dir] = index
+        return index
+
+    @Slot(object, object, str)
+    def on_deskew_finished(self, path: Path, deskew_path: Path, digest: str) -> None:
+        self._deskew_running.discard(path)
+        index = self.deskew_index(deskew_path.parent)
+        if index.get(deskew_path.name) != digest:
+            index[deskew_path.name] = digest
+            self._index_dirty.add(deskew_path.parent)
+            if not self._index_timer.isActive():
+                self._index_timer.start()
+        self.deskew_done(path, deskew_path)
+
+    @Slot(object)
+    def on_deskew_failed(self, path: Path) -> None:
+        # fall back to the raw page instead of retrying it on every visit
+        self._deskew_running.discard(path)
+        self.deskew_done(path, path)
+
+    def deskew_done(self, path: Path, page: Path) -> None:
+        self._deskewed[path] = page
+        if path == self._deskew_wanted:
+            self.show_deskewed(path)
+        elif path in self.neighbour_pages():
+            self.image_view.prefetch(page)
+        self._pump_deskew()
+
+    def show_deskewed(self, path: Path) -> None:
+        self._deskew_wanted = None
+        self.state.current = self._deskewed[path]
         self.image_view.load_image(self.state.current)
 
-        default_export_dir = deskew_dir.parent / "result"
-        self.export_dir.setText(str(default_export_dir))
-
         boxes = self.state.images.get(path)
         if boxes:
             self.image_view.load_boxes(boxes)
 
+        for neighbour in self.neighbour_pages():
+            if neighbour in self._deskewed:
+                self.image_view.prefetch(self._deskewed[neighbour])
+
+        if self._detect_queued:
+            self._detect_queued = False
+            self.detect_current()
+
+    def neighbour_pages(self) -> list[Path]:
+        row = self.file_list.currentRow()
+        rows = (r for r in (row + 1, row - 1) if 0 <= r < self.file_list.count())
+        return [Path(self.file_list.item(r).text()) for r in rows]
+
+    @Slot(QRect)
     def on_selection_finished(self, rect: QRect) -> None:
         if not self.state.current:
             return
@@ -228,38 +493,42 @@ class MainWindow(QMainWindow):
             return
 
         rect_box = Box(rect.left(), rect.top(), rect.width(), rect.height())
-        box = detect_selection(Image.open(self.state.current), rect_box)
+        box = detect_selection(open_page_gray(str(self.state.current), self.state.current.stat().st_mtime_ns), rect_box)
         if box:
             box_item = BoxItem(box)
             self.image_view.scene().addItem(box_item)
             self.image_view.box_items.append(box_item)
 
+    @Slot()
     def detect_current(self) -> None:
+        if self._deskew_wanted is not None:
+            self._detect_queued = True
+            return
         if not self.state.current:
             return
 
-        boxes: list[Box] = []
-        for row in range(self.rule_table.rowCount()):
-            try:
-                item_00 = self.rule_table.item(row, 0)
-                item_01 = self.rule_table.item(row, 1)
-                item_02 = self.rule_table.item(row, 2)
-                item_03 = self.rule_table.item(row, 3)
-                w_min = int(item_00.text() or 0) if item_00 is not None else 0
-                w_max = int(item_01.text() or 0) if item_01 is not None else 0
-                h_min = int(item_02.text() or 0) if item_02 is not None else 0
-                h_max = int(item_03.text() or 0) if item_03 is not None else 0
-            except ValueError:
-                continue
+        self._detect_job += 1
+        worker = DetectWorker(self._detect_job, self.state.current, self.rule_table.rules())
+        worker.signals.finished.connect(self.on_detect_finished)
+        worker.signals.failed.connect(self.on_detect_failed)
+        QThreadPool.globalInstance().start(worker)
 
-            if w_min < w_max and h_min < h_max and max(w_max, h_max) > 0:
-                boxes.extend(detect_image(self.state.current, W_RANGE=(w_min, w_max), H_RANGE=(h_min, h_max)))
+    @Slot(int, object, object)
+    def on_detect_finished(self, job: int, path: Path, final_boxes: list[Box]) -> None:
+        # the user may have moved to another page while detection ran
+        if job != self._detect_job or path != self.state.current:
+            return
 
-        final_boxes = coverage_deduplication(boxes)
-        self.state.images[self.state.current] = final_boxes
-        self.image_view.load_image(self.state.current)
+        self.state.images[path] = final_boxes
+        self.image_view.load_image(path)
         self.image_view.load_boxes(final_boxes)
 
+    @Slot(int)
+    def on_detect_failed(self, job: int) -> None:
+        if job == self._detect_job:
+            self.statusBar().showMessage("Detect failed", STATUS_MESSAGE_MS)
+
+    @Slot()
     def export_current(self) -> None:
         if not self.state.current:
             return
@@ -268,7 +537,7 @@ class MainWindow(QMainWindow):
         out_dir = Path(self.export_dir.text())
         out_dir.mkdir(parents=True, exist_ok=True)
 
-        img = cv2.imread(str(self.state.current))
+        img = read_page(str(self.state.current), self.state.current.stat().st_mtime_ns)
         assert img is not None, f"Failed to load image for export: {self.state.current}"
         ordered_boxes = sort_reading_order(self.image_view.box_items, img.shape[1], column_count)
 
@@ -282,6 +551,7 @@ class MainWindow(QMainWindow):
             except Exception:
                 continue
 
+        crops: list[tuple[Path, np.ndarray]] = []
         for box_item in ordered_boxes:
             box = box_item.box
             cropped = img[box.y : box.y + box.h, box.x : box.x + box.w]
@@ -290,9 +560,13 @@ class MainWindow(QMainWindow):
             while idx in used_indices:
                 idx += 1
             out_path = out_dir / f"{base_name}_{idx:03d}.png"
-            cv2.imwrite(str(out_path), cropped)
+            crops.append((out_path, cropped))
             used_indices.add(idx)
 
+        # PNG encoding releases the GIL, so the crops are written in parallel
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            list(executor.map(lambda crop: write_png(*crop), crops))
+
         # go to next image
         next_row = self.file_list.currentRow() + 1
         if next_row < self.file_list.count():
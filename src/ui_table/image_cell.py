@@ -1,34 +1,73 @@
+from functools import lru_cache
 from pathlib import Path
 
-from PySide6.QtCore import QSize, Qt
-from PySide6.QtGui import QPixmap
-from PySide6.QtWidgets import QLabel
+from PySide6.QtCore import QModelIndex, QObject, QPersistentModelIndex, QRunnable, QSize, Qt, QThreadPool, Signal, Slot
+from PySide6.QtGui import QImage, QImageReader, QPainter, QPixmap
+from PySide6.QtWidgets import QStyle, QStyledItemDelegate, QStyleOptionViewItem, QTableWidget
 
 ROW_HEIGHT = 30
+# scaled thumbnails kept for rows that scroll back into view
+THUMB_CACHE_SIZE = 1024
 
 
-class ImageCellWidget(QLabel):
-    def __init__(self, parent=None) -> None:
-        super().__init__(parent)
-        self.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.setFixedSize(ROW_HEIGHT, ROW_HEIGHT)
-        self._path: Path | None = None
-
-    def set_image(self, path: str | Path | None) -> None:
-        self._path = Path(path) if path else None
-        if self._path and self._path.exists():
-            pix = QPixmap(str(self._path))
-            if not pix.isNull():
-                self.setPixmap(
-                    pix.scaled(
-                        QSize(ROW_HEIGHT, ROW_HEIGHT),
-                        Qt.AspectRatioMode.KeepAspectRatio,
-                        Qt.TransformationMode.SmoothTransformation,
-                    )
-                )
-        else:
-            self.clear()
-
-    @property
-    def path(self) -> Path | None:
-        return self._path
+@lru_cache(maxsize=THUMB_CACHE_SIZE)
+def load_thumbnail(path: str, mtime_ns: int) -> QImage:
+    # QImage, unlike QPixmap, may be decoded and scaled off the GUI thread;
+    # JPEG decodes straight at thumbnail size, other formats are scaled by the reader right after decoding
+    reader = QImageReader(path)
+    size = reader.size()
+    if size.isValid():
+        reader.setScaledSize(size.scaled(QSize(ROW_HEIGHT, ROW_HEIGHT), Qt.AspectRatioMode.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull() or size.isValid():
+        return image
+    return image.scaled(QSize(ROW_HEIGHT, ROW_HEIGHT), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+
+
+class ThumbnailSignals(QObject):
+    # table row, image path, thumbnail
+    finished = Signal(int, str, QImage)
+
+
+class ThumbnailTask(QRunnable):
+    def __init__(self, row: int, path: str, mtime_ns: int) -> None:
+        super().__init__()
+        self.row = row
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.signals = ThumbnailSignals()
+
+    def run(self) -> None:
+        self.signals.finished.emit(self.row, self.path, load_thumbnail(self.path, self.mtime_ns))
+
+
+class ThumbnailDelegate(QStyledItemDelegate):
+    # paints the image column from a pixmap stored on each row's item, so rows need no widget for their thumbnail
+    def __init__(self, table: QTableWidget, column: int) -> None:
+        super().__init__(table)
+        self._table = table
+        self._column = column
+
+    def request(self, row: int, path: str | Path | None) -> None:
+        item = self._table.item(row, self._column)
+        image_path = Path(path) if path else None
+        if item is None or image_path is None or not image_path.exists():
+            return
+        item.setData(Qt.ItemDataRole.UserRole, str(image_path))
+        task = ThumbnailTask(row, str(image_path), image_path.stat().st_mtime_ns)
+        task.signals.finished.connect(self._on_thumbnail)
+        QThreadPool.globalInstance().start(task)
+
+    @Slot(int, str, QImage)
+    def _on_thumbnail(self, row: int, path: str, image: QImage) -> None:
+        # the row may have scrolled out (its item replaced) or the table been rebuilt while this one was decoding
+        item = self._table.item(row, self._column)
+        if item is None or item.data(Qt.ItemDataRole.UserRole) != path or image.isNull():
+            return
+        item.setData(Qt.ItemDataRole.DecorationRole, QPixmap.fromImage(image))
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex | QPersistentModelIndex) -> None:
+        pixmap = index.data(Qt.ItemDataRole.DecorationRole)
+        if isinstance(pixmap, QPixmap) and not pixmap.isNull():
+            target = QStyle.alignedRect(option.direction, Qt.AlignmentFlag.AlignCenter, pixmap.size(), option.rect)
+            painter.drawPixmap(target, pixmap)
@@ -5,32 +5,33 @@ class Editor:
     LINE_SEPARATOR = "*"
 
     @staticmethod
-    def paste_operation(table: Table, start_row: int, col: int, paste_text: str) -> None:
+    def paste_operation(table: Table, start_row: int, col: int, paste_text: str) -> range:
+        # each operation returns the rows it may have changed, so the view can refresh just those
         if not paste_text:
-            return
-
-        parts = paste_text.split()
-        if not parts:
-            return
+            return range(0)
 
         total_rows = len(table)
         max_row = total_rows - 1
 
-        for i, part in enumerate(parts):
-            current_row = start_row + i
-            if current_row < max_row:
-                table.set_cell(current_row, col, part)
-            elif current_row == max_row:
-                remaining_parts = parts[i:]
-                merged_text = Editor.LINE_SEPARATOR.join(remaining_parts)
-                table.set_cell(current_row, col, merged_text)
-                break
+        # one part per row down to the penultimate row, written in a single slice; the rest is merged into the last row.
+        # maxsplit leaves that rest as one unsplit string, so a huge paste is only tokenized once
+        head_count = max(0, max_row - start_row)
+        parts = paste_text.split(None, head_count)
+        if not parts:
+            return range(0)
+
+        changed = range(start_row, min(start_row + len(parts), total_rows))
+        rest = parts.pop() if len(parts) > head_count else None
+        table.set_cells(start_row, col, parts)
+        if rest is not None and start_row <= max_row:
+            table.set_cell(max_row, col, Editor.LINE_SEPARATOR.join(rest.split()))
+        return changed
 
     @staticmethod
-    def merge_operation(table: Table, current_row: int, col: int) -> None:
+    def merge_operation(table: Table, current_row: int, col: int) -> range:
         total_rows = len(table)
         if total_rows < 2 or current_row >= total_rows - 1:
-            return
+            return range(0)
 
         last_row = total_rows - 1
         penultimate_row = last_row - 1
@@ -59,17 +60,16 @@ class Editor:
             merged_text = current_text + next_text
             table.set_cell(current_row, col, merged_text)
 
-            for row in range(current_row + 1, penultimate_row):
-                table.set_cell(row, col, table.get_cell(row + 1, col))
-
+            # shift the rest of the column up in one list operation instead of cell by cell
+            table.remove_cell(current_row + 1, col, split_rest)
             table.set_cell(penultimate_row, col, split_first)
-            table.set_cell(last_row, col, split_rest)
+        return range(current_row, total_rows)
 
     @staticmethod
-    def split_operation(table: Table, current_row: int, col: int, cursor_pos: int, current_text: str) -> None:
+    def split_operation(table: Table, current_row: int, col: int, cursor_pos: int, current_text: str) -> range:
         total_rows = len(table)
         if current_row >= total_rows or cursor_pos >= len(current_text):
-            return
+            return range(0)
 
         text_before_cursor = current_text[:cursor_pos]
         text_after_cursor = current_text[cursor_pos:]
@@ -79,12 +79,11 @@ class Editor:
         last_row_text = table.get_cell(total_rows - 1, col)
         has_last_row_content = bool(last_row_text.strip())
 
-        for row in range(total_rows - 1, current_row + 1, -1):
-            table.set_cell(row, col, table.get_cell(row - 1, col))
-
-        table.set_cell(current_row + 1, col, text_after_cursor)
+        # shift the rest of the column down in one list operation instead of cell by cell
+        table.insert_cell(current_row + 1, col, text_after_cursor)
 
         if has_last_row_content:
             new_last_text = table.get_cell(total_rows - 1, col)
             merged_last_text = new_last_text + Editor.LINE_SEPARATOR + last_row_text
             table.set_cell(total_rows - 1, col, merged_last_text)
+        return range(current_row, total_rows)
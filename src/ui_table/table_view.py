@@ -1,7 +1,7 @@
 from pathlib import Path
-from typing import cast
+from typing import Iterable, cast
 
-from PySide6.QtCore import QEvent, QObject
+from PySide6.QtCore import QEvent, QObject, Qt, QTimer
 from PySide6.QtGui import QKeyEvent, QKeySequence
 from PySide6.QtWidgets import (
     QAbstractItemView,
@@ -17,10 +17,27 @@ from PySide6.QtWidgets import (
 )
 
 from models.table import Table as TableModel
-from ui_table.image_cell import ROW_HEIGHT
+from ui_table.image_cell import ROW_HEIGHT, ThumbnailDelegate
 from ui_table.table_edit import Editor as TableEditor
 from ui_table.visible_rows import RowManager
 
+# scroll and resize bursts materialize row widgets at most once per frame
+VISIBLE_ROWS_INTERVAL_MS = 16
+# standard keys the cell editors handle: paste, merge, split, save, swap up, swap down
+EDIT_KEYS = (
+    QKeySequence.StandardKey.Bold,
+    QKeySequence.StandardKey.Italic,
+    QKeySequence.StandardKey.Underline,
+    QKeySequence.StandardKey.Save,
+    QKeySequence.StandardKey.SelectPreviousLine,
+    QKeySequence.StandardKey.SelectNextLine,
+)
+# modifiers QKeyEvent.matches ignores
+IGNORED_MODIFIERS = Qt.KeyboardModifier.KeypadModifier | Qt.KeyboardModifier.GroupSwitchModifier
+# row-number column: narrowest width, and room around the widest number
+ROW_NUMBER_MIN_WIDTH = 40
+ROW_NUMBER_PADDING = 16
+
 
 class TextTableDialog(QDialog):
     def __init__(self, parent=None) -> None:
@@ -29,8 +46,19 @@ class TextTableDialog(QDialog):
         self.resize(1000, 600)
 
         self.table_model = TableModel()
+        # rows with live widgets: the viewport as of the last visible-rows pass
+        self._inited_rows = range(0)
+        # editor widget -> (row, model col), kept in step with the live widgets of _inited_rows
+        self._edit_index: dict[QLineEdit, tuple[int, int]] = {}
+        self._visible_rows_timer = QTimer(self)
+        self._visible_rows_timer.setSingleShot(True)
+        self._visible_rows_timer.setInterval(VISIBLE_ROWS_INTERVAL_MS)
+        self._visible_rows_timer.timeout.connect(self._ensure_visible_rows)
         self.table_widget = self._create_table_widget()
-        self._inited_rows: set[int] = set()
+        # the platform's bindings for EDIT_KEYS, so a key press costs one dict lookup instead of a matches() per key
+        self._key_actions: dict[int, QKeySequence.StandardKey] = {
+            binding[0].toCombined(): key for key in EDIT_KEYS for binding in QKeySequence.keyBindings(key) if binding.count() == 1
+        }
 
         self.import_images_btn = QPushButton("Import Images")
         self.import_folders_btn = QPushButton("Import Folders")
@@ -67,70 +95,87 @@ class TextTableDialog(QDialog):
         table.setRowCount(0)
 
         header = table.horizontalHeader()
-        # row-number column narrow (col 0)
-        header.setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
-        header.resizeSection(0, 40)
+        # row-number column narrow (col 0); fixed and sized in sync_table_view, since ResizeToContents re-measures
+        # cell contents on every layout change and only sees the rows that happen to have items
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Fixed)
+        header.resizeSection(0, ROW_NUMBER_MIN_WIDTH)
         # image column fixed to thumbnail height (model IMG_COL + 1)
         header.setSectionResizeMode(TableModel.IMG + 1, QHeaderView.ResizeMode.Fixed)
         header.resizeSection(TableModel.IMG + 1, ROW_HEIGHT + 10)
         header.setSectionResizeMode(TableModel.CHR + 1, QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(TableModel.CMT + 1, QHeaderView.ResizeMode.Stretch)
+        table.setItemDelegateForColumn(TableModel.IMG + 1, ThumbnailDelegate(table, TableModel.IMG + 1))
 
-        table.verticalHeader().setVisible(False)
+        # uniform rows: one default height for every row, never a per-row setRowHeight
+        vheader = table.verticalHeader()
+        vheader.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        vheader.setDefaultSectionSize(ROW_HEIGHT)
+        vheader.setVisible(False)
         table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectItems)
         table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
 
         # update visible rows when scrolling or resizing
-        table.verticalScrollBar().valueChanged.connect(lambda _: self._ensure_visible_rows())
+        table.verticalScrollBar().valueChanged.connect(lambda _: self._schedule_visible_rows())
         table.viewport().installEventFilter(self)
         return table
 
+    def _schedule_visible_rows(self) -> None:
+        if not self._visible_rows_timer.isActive():
+            self._visible_rows_timer.start()
+
     def _ensure_visible_rows(self) -> None:
-        RowManager.ensure_visible_rows(self.table_widget, self.table_model, self._inited_rows, self)
+        # one repaint for the whole batch of cell widgets created or torn down, not one per setCellWidget
+        self.table_widget.setUpdatesEnabled(False)
+        try:
+            self._inited_rows = RowManager.ensure_visible_rows(
+                self.table_widget, self.table_model, self._inited_rows, self._edit_index, self
+            )
+        finally:
+            self.table_widget.setUpdatesEnabled(True)
 
     def _get_edit_widget_position(self, edit_widget: QLineEdit) -> tuple[int, int]:
-        for row in range(self.table_widget.rowCount()):
-            widget = self.table_widget.cellWidget(row, TableModel.CHR + 1)
-            if widget == edit_widget:
-                return row, TableModel.CHR
-            widget = self.table_widget.cellWidget(row, TableModel.CMT + 1)
-            if widget == edit_widget:
-                return row, TableModel.CMT
-        return -1, -1
+        return self._edit_index.get(edit_widget, (-1, -1))
 
     def sync_table_view(self) -> None:
-        RowManager.sync_table_view(self.table_widget, self.table_model, self._inited_rows, ROW_HEIGHT)
+        self._inited_rows = RowManager.sync_table_view(self.table_widget, self.table_model, self._edit_index)
+        # the last row has the widest number
+        number_width = self.table_widget.fontMetrics().horizontalAdvance(str(len(self.table_model))) + ROW_NUMBER_PADDING
+        self.table_widget.horizontalHeader().resizeSection(0, max(ROW_NUMBER_MIN_WIDTH, number_width))
         self._ensure_visible_rows()
 
+    def refresh_rows(self, rows: Iterable[int]) -> None:
+        RowManager.refresh_rows(self.table_widget, self.table_model, self._inited_rows, rows)
+
     def eventFilter(self, obj: QObject, event: QEvent) -> bool:
         if obj == self.table_widget.viewport() and event.type() == QEvent.Type.Resize:
-            self._ensure_visible_rows()
+            self._schedule_visible_rows()
             return super().eventFilter(obj, event)
 
         if isinstance(obj, QLineEdit) and event.type() == QEvent.Type.KeyPress:
+            event = cast(QKeyEvent, event)
+            action = self._key_actions.get(event.keyCombination().toCombined() & ~IGNORED_MODIFIERS.value)
+            if action is None:
+                return super().eventFilter(obj, event)
+
             current_row, current_col = self._get_edit_widget_position(obj)
             if current_col not in [TableModel.CHR, TableModel.CMT]:
                 return super().eventFilter(obj, event)
 
-            event = cast(QKeyEvent, event)
-
             # helper: map model col -> widget col
             def model_to_widget_col(mcol: int) -> int:
                 return mcol + 1
 
             # ctrl + b: paste
-            if event.matches(QKeySequence.StandardKey.Bold):
+            if action == QKeySequence.StandardKey.Bold:
                 clipboard_text = QApplication.clipboard().text()
-                TableEditor.paste_operation(self.table_model, current_row, current_col, clipboard_text)
-                self.sync_table_view()
+                self.refresh_rows(TableEditor.paste_operation(self.table_model, current_row, current_col, clipboard_text))
                 obj.setFocus()
                 obj.setCursorPosition(len(obj.text()))
                 return True
 
             # ctrl + i: merge
-            elif event.matches(QKeySequence.StandardKey.Italic):
-                TableEditor.merge_operation(self.table_model, current_row, current_col)
-                self.sync_table_view()
+            elif action == QKeySequence.StandardKey.Italic:
+                self.refresh_rows(TableEditor.merge_operation(self.table_model, current_row, current_col))
                 new_edit = cast(QLineEdit, self.table_widget.cellWidget(current_row, model_to_widget_col(current_col)))
                 if new_edit:
                     new_edit.setFocus()
@@ -138,11 +183,10 @@ class TextTableDialog(QDialog):
                 return True
 
             # ctrl + u: split
-            elif event.matches(QKeySequence.StandardKey.Underline):
+            elif action == QKeySequence.StandardKey.Underline:
                 cursor_pos = obj.cursorPosition()
                 current_text = obj.text()
-                TableEditor.split_operation(self.table_model, current_row, current_col, cursor_pos, current_text)
-                self.sync_table_view()
+                self.refresh_rows(TableEditor.split_operation(self.table_model, current_row, current_col, cursor_pos, current_text))
                 new_edit = cast(QLineEdit, self.table_widget.cellWidget(current_row, model_to_widget_col(current_col)))
                 if new_edit:
                     new_edit.setFocus()
@@ -150,15 +194,15 @@ class TextTableDialog(QDialog):
                 return True
 
             # ctrl + s: save
-            elif event.matches(QKeySequence.StandardKey.Save):
+            elif action == QKeySequence.StandardKey.Save:
                 self.export_tsv()
                 return True
 
             # Shift + Up: swap this cell with the one above (same column)
-            elif event.matches(QKeySequence.StandardKey.SelectPreviousLine):
+            elif action == QKeySequence.StandardKey.SelectPreviousLine:
                 if current_row > 0:
                     self.table_model.swap_cells(current_row, current_col, current_row - 1, current_col)
-                    self.sync_table_view()
+                    self.refresh_rows((current_row - 1, current_row))
                     target_row = current_row - 1
                     new_edit = cast(QLineEdit, self.table_widget.cellWidget(target_row, model_to_widget_col(current_col)))
                     if new_edit:
@@ -167,10 +211,10 @@ class TextTableDialog(QDialog):
                 return True
 
             # Shift + Down: swap this cell with the one below (same column)
-            elif event.matches(QKeySequence.StandardKey.SelectNextLine):
+            elif action == QKeySequence.StandardKey.SelectNextLine:
                 if current_row < len(self.table_model) - 1:
                     self.table_model.swap_cells(current_row, current_col, current_row + 1, current_col)
-                    self.sync_table_view()
+                    self.refresh_rows((current_row, current_row + 1))
                     target_row = current_row + 1
                     new_edit = cast(QLineEdit, self.table_widget.cellWidget(target_row, model_to_widget_col(current_col)))
                     if new_edit:
@@ -252,6 +296,8 @@ class TextTableDialog(QDialog):
             self.table_widget.scrollTo(index, QAbstractItemView.ScrollHint.PositionAtCenter)
         except Exception:
             self.table_widget.scrollTo(index)
+        # materialize the target row's widgets now rather than on the next timer tick, so the editor can take focus
+        self._ensure_visible_rows()
 
         # select the row and focus first editable widget if present
         self.table_widget.setCurrentCell(target_row, 0)
@@ -1,100 +1,91 @@
-from typing import Tuple, cast
+from itertools import chain
+from typing import Iterable, Tuple, cast
 
 from PySide6.QtCore import QObject, Qt
 from PySide6.QtWidgets import QLineEdit, QTableWidget, QTableWidgetItem
 
 from models.table import Table as TableModel
-from ui_table.image_cell import ROW_HEIGHT, ImageCellWidget
+from ui_table.image_cell import ThumbnailDelegate
 
 
 class RowManager:
 
     @classmethod
-    def ensure_visible_rows(cls, table_widget: QTableWidget, table_model: TableModel, inited_rows: set[int], event_owner: QObject) -> None:
+    def ensure_visible_rows(
+        cls,
+        table_widget: QTableWidget,
+        table_model: TableModel,
+        inited_rows: range,
+        edit_index: dict[QLineEdit, tuple[int, int]],
+        event_owner: QObject,
+    ) -> range:
+        # inited_rows is the interval of rows that have live widgets, always the viewport of the previous pass;
+        # the new interval is returned
         start, end = cls.visible_row_range(table_widget)
         if end < start:
-            return
+            return inited_rows
+
+        thumbnails = cast(ThumbnailDelegate, table_widget.itemDelegateForColumn(TableModel.IMG + 1))
+        # widget columns are model columns shifted by +1 (col 0 is row-number); looked up once, not per row
+        img_col, chr_col, cmt_col = TableModel.IMG + 1, TableModel.CHR + 1, TableModel.CMT + 1
+        get_cell = table_model.get_cell
+        cell_widget = table_widget.cellWidget
+        set_item = table_widget.setItem
 
         # create widgets for rows in visible range
         for row in range(start, end + 1):
+            # rows already in view keep their widgets as they are; the dialog pushes model edits into them through
+            # refresh_rows, so a scroll tick only touches rows entering or leaving the viewport
             if row in inited_rows:
-                # widget columns are model columns shifted by +1 (col 0 is row-number)
-                img_col = TableModel.IMG + 1
-                chr_col = TableModel.CHR + 1
-                cmt_col = TableModel.CMT + 1
-
-                # update contents in case model changed
-                widget = table_widget.cellWidget(row, img_col)
-                if widget:
-                    image_path = table_model.get_cell(row, TableModel.IMG)
-                    cast(ImageCellWidget, widget).set_image(image_path)
-                char_w = table_widget.cellWidget(row, chr_col)
-                if char_w:
-                    cast(QLineEdit, char_w).setText(table_model.get_cell(row, TableModel.CHR))
-                cmt_w = table_widget.cellWidget(row, cmt_col)
-                if cmt_w:
-                    cast(QLineEdit, cmt_w).setText(table_model.get_cell(row, TableModel.CMT))
                 continue
 
             # replace simple items with live widgets
-            # remove existing items first
             # remove existing items first (leave row-number at col 0)
-            for col in [TableModel.IMG + 1, TableModel.CHR + 1, TableModel.CMT + 1]:
-                item = table_widget.item(row, col)
-                if item:
+            for col in (img_col, chr_col, cmt_col):
+                if table_widget.item(row, col):
                     table_widget.takeItem(row, col)
 
             # initialize widgets for this row
-            cls.init_table_row(table_widget, table_model, row, event_owner, ROW_HEIGHT)
-
-            # populate data
-            image_path = table_model.get_cell(row, TableModel.IMG)
-            image_cell = cast(ImageCellWidget, table_widget.cellWidget(row, TableModel.IMG + 1))
-            image_cell.set_image(image_path)
-
-            char_text = table_model.get_cell(row, TableModel.CHR)
-            char_edit = cast(QLineEdit, table_widget.cellWidget(row, TableModel.CHR + 1))
-            char_edit.setText(char_text)
+            cls.init_table_row(table_widget, table_model, row, edit_index, event_owner)
 
-            comment_text = table_model.get_cell(row, TableModel.CMT)
-            comment_edit = cast(QLineEdit, table_widget.cellWidget(row, TableModel.CMT + 1))
-            comment_edit.setText(comment_text)
+            # populate data; the editors got their text in init_table_row
+            thumbnails.request(row, get_cell(row, TableModel.IMG))
 
-            inited_rows.add(row)
-
-        # remove widgets for rows outside visible range to free memory
-        to_remove = [r for r in list(inited_rows) if r < start or r > end]
-        for r in to_remove:
-            for col in [TableModel.IMG + 1, TableModel.CHR + 1, TableModel.CMT + 1]:
-                w = table_widget.cellWidget(r, col)
+        # remove widgets for rows outside visible range to free memory: the previous interval's parts above and below
+        above = range(inited_rows.start, min(inited_rows.stop, start))
+        below = range(max(inited_rows.start, end + 1), inited_rows.stop)
+        for r in chain(above, below):
+            for col in (chr_col, cmt_col):
+                w = cell_widget(r, col)
                 if w:
                     table_widget.removeCellWidget(r, col)
+                    edit_index.pop(cast(QLineEdit, w), None)
                     w.deleteLater()
 
-            # put back items to display current text
+            # put back items to display current text; the fresh image item drops the row's thumbnail
             img_placeholder = QTableWidgetItem()
             img_placeholder.setFlags(img_placeholder.flags() & ~(Qt.ItemFlag.ItemIsEditable | Qt.ItemFlag.ItemIsSelectable))
-            table_widget.setItem(r, TableModel.IMG + 1, img_placeholder)
-            table_widget.setItem(r, TableModel.CHR + 1, QTableWidgetItem(table_model.get_cell(r, TableModel.CHR)))
-            table_widget.setItem(r, TableModel.CMT + 1, QTableWidgetItem(table_model.get_cell(r, TableModel.CMT)))
+            set_item(r, img_col, img_placeholder)
+            set_item(r, chr_col, QTableWidgetItem(get_cell(r, TableModel.CHR)))
+            set_item(r, cmt_col, QTableWidgetItem(get_cell(r, TableModel.CMT)))
 
-            inited_rows.discard(r)
+        return range(start, end + 1)
 
     @classmethod
     def init_table_row(
-        cls, table: QTableWidget, table_model: TableModel, row: int, event_filter_owner: QObject, row_height: int = ROW_HEIGHT
+        cls,
+        table: QTableWidget,
+        table_model: TableModel,
+        row: int,
+        edit_index: dict[QLineEdit, tuple[int, int]],
+        event_filter_owner: QObject,
     ) -> None:
-        table.setRowHeight(row, row_height)
-
         # row-number item (no header/title) at column 0
         row_item = QTableWidgetItem(str(row + 1))
         row_item.setFlags(row_item.flags() & ~(Qt.ItemFlag.ItemIsEditable | Qt.ItemFlag.ItemIsSelectable))
         table.setItem(row, 0, row_item)
 
-        # image widget
-        image_cell = ImageCellWidget(table)
-        image_cell.setFocusPolicy(Qt.FocusPolicy.NoFocus)
-        table.setCellWidget(row, TableModel.IMG + 1, image_cell)
+        # image item, painted by the column's ThumbnailDelegate
         placeholder_item = QTableWidgetItem()
         placeholder_item.setFlags(placeholder_item.flags() & ~(Qt.ItemFlag.ItemIsEditable | Qt.ItemFlag.ItemIsSelectable))
         table.setItem(row, TableModel.IMG + 1, placeholder_item)
@@ -104,57 +95,65 @@ class RowManager:
         char_edit.setFrame(False)
         char_edit.setStyleSheet("font-size: 22px;")
         char_edit.installEventFilter(event_filter_owner)
-        char_edit.textChanged.connect(lambda text, r=row, c=TableModel.CHR: table_model.set_cell(r, c, text))
+        # text is filled in before textChanged is connected, so it does not bounce back into the model
+        char_edit.setText(table_model.get_cell(row, TableModel.CHR))
+        set_cell = table_model.set_cell
+        char_edit.textChanged.connect(lambda text, r=row, c=TableModel.CHR: set_cell(r, c, text))
         table.setCellWidget(row, TableModel.CHR + 1, char_edit)
+        edit_index[char_edit] = (row, TableModel.CHR)
 
         # comment editor
         comment_edit = QLineEdit()
         comment_edit.setFrame(False)
         comment_edit.installEventFilter(event_filter_owner)
-        comment_edit.textChanged.connect(lambda text, r=row, c=TableModel.CMT: table_model.set_cell(r, c, text))
+        comment_edit.setText(table_model.get_cell(row, TableModel.CMT))
+        comment_edit.textChanged.connect(lambda text, r=row, c=TableModel.CMT: set_cell(r, c, text))
         table.setCellWidget(row, TableModel.CMT + 1, comment_edit)
+        edit_index[comment_edit] = (row, TableModel.CMT)
 
     @staticmethod
-    def sync_table_view(table: QTableWidget, table_model: TableModel, inited_rows: set[int], row_height: int = ROW_HEIGHT) -> None:
-        inited_rows.clear()
+    def sync_table_view(
+        table: QTableWidget,
+        table_model: TableModel,
+        edit_index: dict[QLineEdit, tuple[int, int]],
+    ) -> range:
+        edit_index.clear()
         table.setRowCount(0)
-        row_count = len(table_model)
-        table.setRowCount(row_count)
-
-        for row in range(row_count):
-            table.setRowHeight(row, row_height)
+        # rows take the vertical header's fixed default height; items and widgets are only created by
+        # ensure_visible_rows for rows that scroll into view, so a rebuild costs O(visible rows), not O(rows)
+        table.setRowCount(len(table_model))
+        # no row has widgets yet
+        return range(0)
 
-            # row-number
-            row_item = QTableWidgetItem(str(row + 1))
-            row_item.setFlags(row_item.flags() & ~(Qt.ItemFlag.ItemIsEditable | Qt.ItemFlag.ItemIsSelectable))
-            table.setItem(row, 0, row_item)
-
-            # image placeholder (non-editable)
-            placeholder_item = QTableWidgetItem()
-            placeholder_item.setFlags(placeholder_item.flags() & ~(Qt.ItemFlag.ItemIsEditable | Qt.ItemFlag.ItemIsSelectable))
-            table.setItem(row, TableModel.IMG + 1, placeholder_item)
-
-            # simple text items for non-visible rows; widgets will replace these when visible
-            char_text = table_model.get_cell(row, TableModel.CHR)
-            char_item = QTableWidgetItem(char_text)
-            table.setItem(row, TableModel.CHR + 1, char_item)
-
-            comment_text = table_model.get_cell(row, TableModel.CMT)
-            comment_item = QTableWidgetItem(comment_text)
-            table.setItem(row, TableModel.CMT + 1, comment_item)
+    @staticmethod
+    def refresh_rows(table: QTableWidget, table_model: TableModel, inited_rows: range, rows: Iterable[int]) -> None:
+        # push model text into existing widgets/items of the given rows, without rebuilding the table
+        for row in rows:
+            for col in (TableModel.CHR + 1, TableModel.CMT + 1):
+                text = table_model.get_cell(row, col - 1)
+                if row in inited_rows:
+                    widget = cast(QLineEdit, table.cellWidget(row, col))
+                    if widget and widget.text() != text:
+                        # the model already holds text, so textChanged must not write it back
+                        widget.blockSignals(True)
+                        widget.setText(text)
+                        widget.blockSignals(False)
+                else:
+                    item = table.item(row, col)
+                    if item:
+                        item.setText(text)
 
     @classmethod
     def visible_row_range(cls, table: QTableWidget) -> Tuple[int, int]:
-        if table.rowCount() == 0:
+        row_count = table.rowCount()
+        if row_count == 0:
             return 0, -1
 
-        top = table.rowAt(0)
-        if top == -1:
-            top = 0
-
-        viewport_h = table.viewport().height()
-        bottom = table.rowAt(viewport_h - 1)
-        if bottom == -1:
-            bottom = max(0, table.rowCount() - 1)
-
+        # every row has the header's fixed default height (TextTableDialog), so the range is plain arithmetic on the
+        # header's pixel offset instead of two rowAt() lookups
+        header = table.verticalHeader()
+        row_height = header.defaultSectionSize()
+        offset = header.offset()
+        top = min(offset // row_height, row_count - 1)
+        bottom = min((offset + table.viewport().height() - 1) // row_height, row_count - 1)
         return top, bottom